@@ -0,0 +1,106 @@
+# answer_cache.py
+import json
+import sqlite3
+import hashlib
+import numpy as np
+from langchain_core.documents import Document
+
+class AnswerCache:
+    """
+    On-disk cache of chatbot answers in SQLite, keyed on the query and the chat history.
+    Lookups first try an exact match on the normalized query text, then fall back to
+    the most similar cached query (cosine similarity >= threshold) with the same history.
+    Every entry belongs to a namespace (see AnswerCache.namespace_key) identifying the
+    handbook, models and prompts it was answered with; only the current namespace is read.
+    """
+
+    def __init__(self, db_path: str, namespace: str, threshold: float = 0.92):
+        self.db_path = db_path
+        self.namespace = namespace
+        self.threshold = threshold
+        self.conn = sqlite3.connect(db_path)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(cache)")]
+        if columns and "namespace" not in columns:
+            # Entries written before namespaces existed can't be attributed to a handbook or model
+            self.conn.execute("DROP TABLE cache")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                query_sha TEXT NOT NULL,
+                history_hash TEXT NOT NULL,
+                query TEXT NOT NULL,
+                query_embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                PRIMARY KEY (namespace, query_sha, history_hash)
+            )
+            """
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def namespace_key(*parts: str) -> str:
+        """SHA-256 over everything an answer depends on besides the query and history."""
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def query_sha(query: str) -> str:
+        """SHA-256 of the query with case and whitespace normalized."""
+        return hashlib.sha256(" ".join(query.lower().split()).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def history_hash(chat_history: list) -> str:
+        """Stable hash of a list of (question, answer) turns."""
+        return hashlib.sha256(json.dumps(chat_history).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _decode_row(answer: str, sources: str):
+        return answer, [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in json.loads(sources)]
+
+    def get(self, query: str, history_hash: str):
+        """Exact lookup. Returns (answer, source_documents) or None."""
+        row = self.conn.execute(
+            "SELECT answer, sources FROM cache WHERE namespace = ? AND query_sha = ? AND history_hash = ?",
+            (self.namespace, self.query_sha(query), history_hash),
+        ).fetchone()
+        return self._decode_row(*row) if row else None
+
+    def get_similar(self, query_embedding, history_hash: str):
+        """Semantic lookup against cached queries with the same history. Returns (answer, source_documents) or None."""
+        # Score on embeddings only; the answer and sources are read for the best match alone
+        rows = self.conn.execute(
+            "SELECT rowid, query_embedding FROM cache WHERE namespace = ? AND history_hash = ?",
+            (self.namespace, history_hash),
+        ).fetchall()
+        if not rows:
+            return None
+        # Stored embeddings are L2-normalized float32, so a dot product is the cosine similarity
+        matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        scores = matrix @ self._normalize(query_embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        row = self.conn.execute("SELECT answer, sources FROM cache WHERE rowid = ?", (rows[best][0],)).fetchone()
+        return self._decode_row(*row)
+
+    def add(self, query: str, history_hash: str, query_embedding, answer: str, source_documents: list):
+        """Inserts (or replaces) the answer for a query and history."""
+        sources = json.dumps([{"page_content": d.page_content, "metadata": d.metadata} for d in source_documents])
+        self.conn.execute(
+            "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.namespace, self.query_sha(query), history_hash, query, self._normalize(query_embedding).tobytes(), answer, sources),
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -1,9 +1,117 @@
 # app.py
 import os
+import re
+import atexit
+import asyncio
+import httpx
 from dotenv import load_dotenv
-from pdf_processor import download_pdf, extract_text_pypdf
-from rag_pipeline import get_text_chunks, create_vector_store, build_conversational_rag_chain
+from pdf_processor import download_pdf, extract_text_pypdf, file_sha256
+from rag_pipeline import get_text_chunks, create_vector_store, build_conversational_rag_chain, vector_store_key
+from answer_cache import AnswerCache
+from prompts import SYSTEM_PROMPT, HUMAN_PROMPT
+from config import (
+    ANSWER_CACHE_PATH, ANSWER_CACHE_THRESHOLD, CHAT_MODEL_NAME,
+    HTTP_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS
+)
 import openai # Import openai for specific error types
+import requests # Import requests for network error types
+
+# Splits "Concise Answer: ... Reasoning: ..." in a single pass; the Reasoning section is optional
+_ANSWER_RE = re.compile(r"Concise Answer:\s*(?P<answer>.*?)\s*(?:Reasoning:\s*(?P<reasoning>.*))?$", re.DOTALL)
+
+# Flattens line breaks and tabs in source previews in a single pass
+_NL_TABLE = str.maketrans({'\n': ' ', '\r': ' ', '\t': ' '})
+
+async def chat_loop(qa_chain, vectorstore, answer_cache: AnswerCache):
+    """Simple CLI chat interface, run on an asyncio event loop."""
+    retriever = qa_chain.retriever # QueryEmbeddingRetriever built by build_conversational_rag_chain
+
+    print("\n--- Chatbot Ready! Type 'exit' to quit ---")
+    chat_history = []
+
+    while True:
+        # Read directly: nothing else runs on the loop while the user types, and Ctrl-C interrupts input() at once
+        user_query = input("\nYou: ")
+        if user_query.lower() == 'exit':
+            break
+
+        try:
+            retriever.clear_embeddings() # Drop an unused embedding from the previous turn
+
+            # Check for the same question (exact, then semantically equivalent) asked after the same conversation
+            history_hash = AnswerCache.history_hash(chat_history)
+            cached = answer_cache.get(user_query, history_hash)
+            query_embedding = None
+            if not cached:
+                query_embedding = await asyncio.to_thread(vectorstore.embeddings.embed_query, user_query)
+                cached = answer_cache.get_similar(query_embedding, history_hash)
+                if not cached and not chat_history:
+                    # With no history the chain retrieves for the question as typed, so let it reuse
+                    # this embedding; later questions are rephrased by the chain first
+                    retriever.provide_embedding(user_query, query_embedding)
+
+            if cached:
+                full_answer_text, source_documents = cached
+                # Keep the chain's memory in step with the conversation on a cache hit. Once the history
+                # passes MEMORY_MAX_TOKEN_LIMIT this makes a summarization call, so even a cache hit can
+                # wait on the LLM; it runs on a worker thread to keep the event loop free meanwhile
+                await asyncio.to_thread(qa_chain.memory.save_context, {"question": user_query}, {"answer": full_answer_text})
+            else:
+                # The actual call to OpenAI for answering the question.
+                # The answer is streamed to stdout token by token while it is generated.
+                print("Chatbot: ", end="", flush=True)
+                result = await asyncio.to_thread(qa_chain.invoke, {"question": user_query, "chat_history": chat_history})
+                print()
+                full_answer_text = result["answer"]
+                source_documents = result.get("source_documents", [])
+                answer_cache.add(user_query, history_hash, query_embedding, full_answer_text, source_documents)
+
+            # --- Parsing the Concise Answer (kept in the chat history) ---
+            match = _ANSWER_RE.search(full_answer_text)
+            if match:
+                concise_answer = match.group("answer").strip()
+            else:
+                concise_answer = full_answer_text # Fallback
+
+            if cached: # Print cached answers exactly as they would have been streamed
+                print(f"Chatbot: {full_answer_text}")
+
+            # --- Processing and Displaying Source Documents ---
+            if source_documents:
+                print("\nSources:")
+                displayed_sources = []
+                seen_sources = set()
+
+                for doc in source_documents:
+                    if len(displayed_sources) == 3: # Display top 3 unique sources
+                        break
+
+                    page_info = doc.metadata.get('page', 'N/A')
+                    source_file = os.path.basename(doc.metadata.get('source', 'N/A'))
+                    source_key = (page_info, source_file)
+
+                    if source_key not in seen_sources:
+                        seen_sources.add(source_key)
+                        clean_content = doc.page_content[:150].translate(_NL_TABLE)
+                        displayed_sources.append(f"- Source {len(displayed_sources)+1} (Page {page_info} of {source_file}): {clean_content}")
+
+                for src_text in displayed_sources:
+                    print(src_text)
+            
+            chat_history.append((user_query, concise_answer))
+
+        except (openai.APIError, requests.exceptions.RequestException) as e:
+            print(f"Chatbot Error (API/Network): {e}")
+            if "Incorrect API key" in str(e) or "authentication error" in str(e).lower():
+                print("It looks like your OpenAI API key is invalid or has issues. Please verify it.")
+            elif "rate limit" in str(e).lower():
+                print("You might be hitting OpenAI's rate limits. Please wait a moment and try again.")
+            else:
+                print("A network or API communication error occurred. Please check your internet connection and try again.")
+            # Do not add to chat history if there was an error
+        except Exception as e:
+            print(f"An unexpected error occurred during chat interaction: {e}")
+            print("Please try your query again or restart the application.")
 
 def main():
     # Load environment variables
@@ -15,6 +123,14 @@ def main():
         print("Error: OPENAI_API_KEY not found in .env file. Please set it.")
         return
 
+    # One pooled HTTP/2 client shared by every synchronous OpenAI call (query embeddings,
+    # question rephrasing, answers), so connections stay alive between calls
+    http_client = httpx.Client(
+        http2=True, timeout=HTTP_TIMEOUT,
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS),
+    )
+    atexit.register(http_client.close)
+
     # PDF Configuration
     PDF_URL = "https://www.aetnabetterhealth.com/content/dam/aetna/medicaid/illinois/pdf/ABHIL_Member_Handbook.pdf"
     LOCAL_PDF_PATH = "ABHIL_Member_Handbook.pdf"
@@ -25,7 +141,8 @@ def main():
         return
 
     # --- 2. Extract Text ---
-    docs = extract_text_pypdf(LOCAL_PDF_PATH)
+    pdf_sha256 = file_sha256(LOCAL_PDF_PATH) # Hashed once; keys the extraction, vector store and answer caches
+    docs = extract_text_pypdf(LOCAL_PDF_PATH, pdf_sha256)
     if not docs:
         print("Failed to extract text from PDF. Exiting.")
         return
@@ -41,7 +158,7 @@ def main():
     # --- 4. Create/Load Vector Store ---
     vectorstore = None
     try:
-        vectorstore = create_vector_store(chunks, openai_api_key)
+        vectorstore = create_vector_store(chunks, openai_api_key, LOCAL_PDF_PATH, http_client=http_client, pdf_sha256=pdf_sha256)
     except ValueError as ve: # Catch the specific ValueError for invalid API key
         print(f"Critical Error during vector store creation: {ve}. Please fix your API key.")
         return
@@ -57,7 +174,7 @@ def main():
     # --- 5. Build Conversational RAG Chain ---
     qa_chain = None
     try:
-        qa_chain = build_conversational_rag_chain(vectorstore, openai_api_key, cohere_api_key)
+        qa_chain = build_conversational_rag_chain(vectorstore, openai_api_key, cohere_api_key, http_client=http_client)
     except Exception as e:
         print(f"Error building conversational RAG chain: {e}")
         print("Please check your OpenAI API key and Cohere API key (if used) and ensure all dependencies are installed.")
@@ -67,73 +184,20 @@ def main():
         print("RAG chain could not be initialized. Exiting.")
         return
 
-    print("\n--- Chatbot Ready! Type 'exit' to quit ---")
-    chat_history = []
-
-    while True:
-        user_query = input("\nYou: ")
-        if user_query.lower() == 'exit':
-            break
-
-        try:
-            # The actual call to OpenAI for answering the question
-            result = qa_chain.invoke({"question": user_query, "chat_history": chat_history})
-            full_answer_text = result["answer"]
-
-            # --- Parsing the Answer and Reasoning (as discussed previously) ---
-            concise_answer = ""
-            reasoning = ""
-
-            if "Concise Answer:" in full_answer_text:
-                parts = full_answer_text.split("Reasoning:", 1)
-                concise_answer_part = parts[0].replace("Concise Answer:", "").strip()
-                concise_answer = concise_answer_part
-                if len(parts) > 1:
-                    reasoning = parts[1].strip()
-            else:
-                concise_answer = full_answer_text # Fallback
-
-            print(f"Chatbot: {concise_answer}")
-            if reasoning:
-                print(f"\nReasoning: {reasoning}")
-
-            # --- Processing and Displaying Source Documents ---
-            source_documents = result.get("source_documents", [])
-            if source_documents:
-                print("\nSources:")
-                displayed_sources = []
-                seen_sources = set()
-
-                for i, doc in enumerate(source_documents):
-                    page_info = doc.metadata.get('page', 'N/A')
-                    source_file = os.path.basename(doc.metadata.get('source', 'N/A'))
-                    source_identifier = f"Page {page_info} of {source_file}"
-
-                    if source_identifier not in seen_sources:
-                        clean_content = doc.page_content[:150].replace('\n', ' ')
-                        displayed_sources.append(f"- Source {len(displayed_sources)+1} ({source_identifier}): {clean_content}")
-                        seen_sources.add(source_identifier)
-                    
-                    if len(displayed_sources) >= 3: # Display top 3 unique sources
-                        break
+    # --- 6. Open Answer Cache ---
+    # Answers are only reused for the same handbook/index, chat model and prompts
+    namespace = AnswerCache.namespace_key(vector_store_key(LOCAL_PDF_PATH, pdf_sha256), CHAT_MODEL_NAME, SYSTEM_PROMPT, HUMAN_PROMPT)
+    answer_cache = AnswerCache(ANSWER_CACHE_PATH, namespace, threshold=ANSWER_CACHE_THRESHOLD)
+    print(f"Answer cache at {ANSWER_CACHE_PATH} holds {len(answer_cache)} answers.")
 
-                for src_text in displayed_sources:
-                    print(src_text)
-            
-            chat_history.append((user_query, concise_answer))
-
-        except (openai.APIError, requests.exceptions.RequestException) as e:
-            print(f"Chatbot Error (API/Network): {e}")
-            if "Incorrect API key" in str(e) or "authentication error" in str(e).lower():
-                print("It looks like your OpenAI API key is invalid or has issues. Please verify it.")
-            elif "rate limit" in str(e).lower():
-                print("You might be hitting OpenAI's rate limits. Please wait a moment and try again.")
-            else:
-                print("A network or API communication error occurred. Please check your internet connection and try again.")
-            # Do not add to chat history if there was an error
-        except Exception as e:
-            print(f"An unexpected error occurred during chat interaction: {e}")
-            print("Please try your query again or restart the application.")
+    # A plain event loop rather than asyncio.run, whose SIGINT handler would only cancel the
+    # chat task and leave a Ctrl-C at the prompt stuck inside input()
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(chat_loop(qa_chain, vectorstore, answer_cache))
+    finally:
+        loop.close()
+        answer_cache.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
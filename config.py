@@ -6,17 +6,36 @@ import os
 PDF_URL = "https://www.aetnabetterhealth.com/content/dam/aetna/medicaid/illinois/pdf/ABHIL_Member_Handbook.pdf"
 LOCAL_PDF_PATH = "ABHIL_Member_Handbook.pdf"
 
-# --- ChromaDB Configuration ---
-CHROMA_DB_DIR = "./chroma_db" # Directory to store ChromaDB persistent data
+# --- Vector Store (FAISS) Configuration ---
+VECTOR_STORE_DIR = "./faiss_index" # Directory to store persisted FAISS indexes
+# One subdirectory per (PDF hash, chunking parameters, embedding model) combination
+HNSW_M = 32 # Neighbors per node in the HNSW graph
+HNSW_EF_CONSTRUCTION = 200 # Candidate list size while building the graph (higher = better recall, slower build)
+HNSW_EF_SEARCH = 64 # Candidate list size at query time (must be >= the retriever's k)
+VERIFY_INDEX_RECALL = False # Print recall@10 on held-out queries after a build (builds a second, scratch index)
+
+# --- Answer Cache Configuration ---
+ANSWER_CACHE_PATH = "./answer_cache.sqlite3" # SQLite file with cached answers, keyed on handbook/model/prompts, query and chat history
+ANSWER_CACHE_THRESHOLD = 0.92 # Minimum cosine similarity for a previous answer to be reused
 
 # --- Chunking Strategy Parameters ---
-CHUNK_SIZE = 1000   # Max characters per chunk. ~750 tokens for English.
-CHUNK_OVERLAP = 100 # Overlap between chunks to maintain context
+CHUNK_SIZE = 250    # Max tokens per chunk (embedding model's tokenizer). ~1000 characters for English.
+CHUNK_OVERLAP = 25  # Overlap in tokens between chunks to maintain context
 
 # --- OpenAI Model Configuration ---
 EMBEDDING_MODEL_NAME = "text-embedding-ada-002" 
+# Per-chunk embeddings keyed by content hash; one file per embedding model, so vectors from different models never mix
+EMBEDDING_CACHE_PATH = os.path.join(VECTOR_STORE_DIR, f"embeddings_cache_{EMBEDDING_MODEL_NAME}.npz")
+EMBEDDING_BATCH_SIZE = 128 # Chunks sent per embeddings request during ingestion
+EMBEDDING_CONCURRENCY = 10 # Embeddings requests in flight at once during ingestion
 CHAT_MODEL_NAME = "gpt-3.5-turbo" # 'gpt-4o' for higher quality, but more expensive
 TEMPERATURE = 0.7 # Controls randomness of LLM output (0.0 for deterministic, 1.0 for creative)
+MEMORY_MAX_TOKEN_LIMIT = 600 # Chat history tokens kept verbatim; older turns are summarized by the LLM
+
+# --- HTTP Client Configuration (OpenAI calls) ---
+HTTP_TIMEOUT = 30.0 # Seconds
+HTTP_MAX_CONNECTIONS = 32
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 16
 
 # --- Reranking Configuration (Optional) ---
 # If you want to use Cohere Rerank, uncomment the line below and ensure COHERE_API_KEY is set in .env
@@ -0,0 +1,24 @@
+# normalized_embeddings.py
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+
+def l2_normalize(vectors: list) -> list:
+    """L2-normalizes each row of a list of vectors."""
+    array = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(array, axis=-1, keepdims=True)
+    return (array / np.where(norms == 0, 1, norms)).tolist()
+
+class NormalizedOpenAIEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings returning unit-length vectors, so queries match the inner-product index."""
+
+    def embed_documents(self, texts: list, chunk_size: int = 0) -> list:
+        return l2_normalize(super().embed_documents(texts, chunk_size))
+
+    def embed_query(self, text: str) -> list:
+        return l2_normalize([super().embed_query(text)])[0]
+
+    async def aembed_documents(self, texts: list, chunk_size: int = 0) -> list:
+        return l2_normalize(await super().aembed_documents(texts, chunk_size))
+
+    async def aembed_query(self, text: str) -> list:
+        return l2_normalize([await super().aembed_query(text)])[0]
@@ -1,9 +1,18 @@
 # pdf_processor.py
 import os
+import glob
+import hashlib
+import multiprocessing
 import requests
 import fitz  # PyMuPDF
 from langchain_core.documents import Document
 
+# Part of the extraction cache file name; change it whenever _extract_range produces different text
+_EXTRACTION_VERSION = "blocks1"
+
+# Below this many pages, extracting serially beats the cost of spawning worker processes
+_PARALLEL_MIN_PAGES = 200
+
 def download_pdf(url: str, local_path: str) -> bool:
     """Downloads the PDF file if it doesn't exist locally."""
     if not os.path.exists(local_path):
@@ -15,41 +24,120 @@ def download_pdf(url: str, local_path: str) -> bool:
                 'Accept-Language': 'en-US,en;q=0.9',
                 'Referer': 'https://www.aetnabetterhealth.com/illinois-medicaid/member-materials-forms.html' # Or the page where you found the link
             }
-            response = requests.get(url, headers=headers)
-            response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
-            with open(local_path, 'wb') as f:
-                f.write(response.content)
+            # Stream to a temporary file so a failed download never leaves a partial PDF behind
+            partial_path = local_path + ".part"
+            with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+                response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
+                with open(partial_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1 << 16): # 64 KiB chunks
+                        f.write(chunk)
+            os.replace(partial_path, local_path)
             print(f"PDF downloaded to {local_path}")
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, OSError) as e:
             print(f"Error downloading PDF: {e}")
+            if os.path.exists(local_path + ".part"):
+                os.remove(local_path + ".part")
             return False
     else:
         print(f"PDF already exists at {local_path}. Skipping download.")
     return True
 
-def extract_text_pypdf(pdf_path: str) -> list[Document]:
+def file_sha256(path: str) -> str:
+    """Returns the hex SHA-256 digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _extract_range(pdf_path: str, start: int, end: int) -> list[tuple[int, str]]:
+    """
+    Worker for extract_text_pypdf: opens the PDF independently and extracts
+    pages [start, end). Returns (page_num, text) tuples.
+    """
+    results = []
+    doc = fitz.open(pdf_path)
+    try:
+        for page_num in range(start, end):
+            page = doc.load_page(page_num)
+            # "blocks" returns (x0, y0, x1, y1, text, block_no, block_type) tuples
+            blocks = page.get_text("blocks")
+            blocks.sort(key=lambda b: (b[1], b[0])) # Reading order: top-to-bottom, then left-to-right
+            text = "\n".join(b[4] for b in blocks if b[6] == 0) # Skip image blocks (block_type 1)
+            results.append((page_num, text))
+    finally:
+        doc.close()
+    return results
+
+def _extract_star(args: tuple) -> list[tuple[int, str]]:
+    """Unpacks a (pdf_path, start, end) tuple for Pool.imap_unordered."""
+    return _extract_range(*args)
+
+def extract_text_pypdf(pdf_path: str, pdf_sha256: str = None) -> list[Document]:
     """
     Extracts all text content from the PDF using PyMuPDF (Fitz).
+    Documents of _PARALLEL_MIN_PAGES pages or more are split into contiguous
+    ranges and extracted in parallel, one range per CPU core.
+    Extracted pages are cached in a Parquet file keyed on the PDF's SHA-256
+    (pdf_sha256, computed here if not given) and _EXTRACTION_VERSION,
+    so an unchanged PDF is not re-parsed on the next run.
     Returns a list of Langchain Document objects, each representing a page.
     """
+    import pandas as pd # Imported here so spawned extraction workers don't pay for it
+
     documents = []
     try:
-        doc = fitz.open(pdf_path)
-        print(f"Extracting text from {doc.page_count} pages...")
-        
-        for page_num in range(doc.page_count):
-            page = doc.load_page(page_num)
-            text = page.get_text("text") # "text" extracts plain text
-            
+        cache_path = f"{pdf_path}.{pdf_sha256 or file_sha256(pdf_path)}.{_EXTRACTION_VERSION}.parquet"
+        if os.path.exists(cache_path):
+            try:
+                pages = pd.read_parquet(cache_path)
+                print(f"Loaded {len(pages)} extracted pages from cache {cache_path}.")
+                return [
+                    Document(page_content=text, metadata={"source": pdf_path, "page": page})
+                    for page, text in zip(pages["page"].tolist(), pages["text"].tolist())
+                ]
+            except Exception as e:
+                print(f"Could not read extraction cache ({e}). Re-extracting text.")
+
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+        print(f"Extracting text from {page_count} pages...")
+
+        workers = max(1, min(multiprocessing.cpu_count(), page_count))
+        if workers == 1 or page_count < _PARALLEL_MIN_PAGES:
+            pages = _extract_range(pdf_path, 0, page_count)
+        else:
+            # One contiguous page range per worker
+            step = -(-page_count // workers) # Ceiling division
+            ranges = [(pdf_path, start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+            pages = []
+            # "spawn" gives each worker a fresh MuPDF state; callers must guard with if __name__ == "__main__"
+            with multiprocessing.get_context("spawn").Pool(processes=len(ranges)) as pool:
+                for page_texts in pool.imap_unordered(_extract_star, ranges):
+                    pages.extend(page_texts)
+            pages.sort(key=lambda p: p[0])
+
+        for page_num, text in pages:
             # Create a Langchain Document object for each page
             # Metadata is important for source attribution in RAG
             documents.append(Document(
                 page_content=text,
                 metadata={"source": pdf_path, "page": page_num + 1}
             ))
-            
-        doc.close()
-    
+
+        try:
+            pd.DataFrame({
+                "page": [d.metadata["page"] for d in documents],
+                "text": [d.page_content for d in documents],
+            }).to_parquet(cache_path, compression="zstd", index=False)
+            # Caches of earlier versions of this PDF (or of the extraction) will never be read again
+            for stale_path in glob.glob(f"{glob.escape(pdf_path)}.*.parquet"):
+                if stale_path != cache_path:
+                    os.remove(stale_path)
+        except Exception as e:
+            print(f"Could not write extraction cache: {e}")
+
     except Exception as e:
         print(f"An error occurred during text extraction: {e}")
         return []
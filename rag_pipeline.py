@@ -1,103 +1,372 @@
 # rag_pipeline.py
 
+from __future__ import annotations
+
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_community.vectorstores import Chroma
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from langchain_core.prompts import PromptTemplate
-from langchain.retrievers.contextual_compression import ContextualCompressionRetriever
-from langchain.retrievers.document_compressors import CohereRerank
+import re
+import asyncio
+import functools
+import hashlib
+from typing import TYPE_CHECKING
+import numpy as np
+# langchain_core is already loaded by pdf_processor; the heavier LangChain integrations,
+# FAISS, tiktoken and the OpenAI client are imported inside the functions that use them
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
 
 from config import (
     CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL_NAME, 
-    CHAT_MODEL_NAME, TEMPERATURE, CHROMA_DB_DIR
+    CHAT_MODEL_NAME, TEMPERATURE, VECTOR_STORE_DIR, EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY,
+    EMBEDDING_CACHE_PATH, LOCAL_PDF_PATH, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, VERIFY_INDEX_RECALL,
+    MEMORY_MAX_TOKEN_LIMIT, HTTP_TIMEOUT
 )
+from pdf_processor import file_sha256
+from prompts import SYSTEM_PROMPT, HUMAN_PROMPT
 
 # Optional: Import RERANK_MODEL_NAME and RERANK_TOP_N if using reranking
 # from config import RERANK_MODEL_NAME, RERANK_TOP_N 
 
+# Preferred chunk start boundaries, strongest first: paragraph, line, sentence, word
+_SEPARATORS = ["\n\n", "\n", ". ", " "]
+
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    """The embedding model's tiktoken encoding, loaded once per process."""
+    import tiktoken
+    return tiktoken.encoding_for_model(EMBEDDING_MODEL_NAME)
+
 def get_text_chunks(documents: list) -> list:
-    """Splits a list of Langchain Document objects into smaller chunks."""
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        length_function=len, # Use character length
-        add_start_index=True, # Adds start index to metadata
-    )
-    chunks = text_splitter.split_documents(documents)
+    """
+    Splits a list of Langchain Document objects into chunks of CHUNK_SIZE tokens
+    with CHUNK_OVERLAP tokens of overlap. Each page is tokenized once with tiktoken
+    and chunk boundaries are computed with NumPy. Each chunk start is moved back to
+    the strongest separator in _SEPARATORS (paragraph, line, sentence, word) that
+    falls within the overlap window, so chunks rarely begin mid-word or mid-sentence.
+    """
+    enc = _encoding()
+    step = CHUNK_SIZE - CHUNK_OVERLAP
+    chunks = []
+
+    for doc in documents:
+        text = doc.page_content
+        tokens = enc.encode(text)
+        if not tokens:
+            continue
+        n_tokens = len(tokens)
+        # Character offset of every token, plus the end of the text, for slicing the original string
+        _, offsets = enc.decode_with_offsets(tokens)
+        token_starts = np.asarray(offsets, dtype=np.int64)
+        char_offsets = np.append(token_starts, len(text))
+
+        # Fixed windows, before snapping
+        starts = np.arange(0, n_tokens, step)
+        window_chars = char_offsets[starts]
+        earliest_chars = char_offsets[np.maximum(starts - CHUNK_OVERLAP, 0)]
+
+        start_chars = window_chars.copy()
+        snapped = starts == 0 # The first chunk always starts at the beginning of the page
+        for separator in _SEPARATORS:
+            if snapped.all():
+                break
+            # Character positions just after each occurrence of the separator
+            boundaries = np.fromiter((m.end() for m in re.finditer(re.escape(separator), text)), dtype=np.int64)
+            if not boundaries.size:
+                continue
+            # Latest boundary at or before each window start, used if it lies within the overlap
+            idx = np.searchsorted(boundaries, window_chars, side="right") - 1
+            candidates = np.where(idx >= 0, boundaries[np.maximum(idx, 0)], -1)
+            use = ~snapped & (candidates >= earliest_chars)
+            start_chars = np.where(use, candidates, start_chars)
+            snapped |= use
+
+        # Each chunk spans CHUNK_SIZE tokens from the token containing its start character
+        start_tokens = np.searchsorted(token_starts, start_chars, side="right") - 1
+        end_tokens = np.minimum(start_tokens + CHUNK_SIZE, n_tokens)
+        # Drop trailing windows only after snapping: a window is redundant once the previous chunk reaches the end of the page
+        keep = np.concatenate(([True], end_tokens[:-1] < n_tokens))
+        start_chars, end_chars = start_chars[keep], char_offsets[end_tokens[keep]]
+
+        for start, end in zip(start_chars.tolist(), end_chars.tolist()):
+            chunk_text = text[start:end]
+            if chunk_text.strip():
+                chunks.append(Document(
+                    page_content=chunk_text,
+                    metadata={**doc.metadata, "start_index": start} # Character start index, as before
+                ))
+
     print(f"Created {len(chunks)} chunks from the PDF.")
     return chunks
 
-def create_vector_store(chunks: list, openai_api_key: str) -> Chroma:
+def _load_embedding_cache(path: str) -> dict:
+    """Loads the per-chunk embedding cache as {sha256(chunk text): vector}."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path) as data:
+            return dict(zip(data["keys"].tolist(), data["vectors"]))
+    except Exception as e:
+        print(f"Could not read embedding cache at {path} ({e}). Re-embedding all chunks.")
+        return {}
+
+def _save_embedding_cache(path: str, cache: dict):
+    """Persists the per-chunk embedding cache to a compressed .npz file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    keys = list(cache)
+    np.savez_compressed(
+        path,
+        keys=np.array(keys),
+        vectors=np.array([cache[k] for k in keys], dtype=np.float32),
+    )
+
+# Parts of the vector store cache key; change them whenever the chunking
+# algorithm or the index type/metric changes
+_CHUNKING_VERSION = "sep2"
+_INDEX_LAYOUT = "hnsw-sq8-ip"
+
+def _new_hnsw_index(vectors: np.ndarray):
+    """Empty HNSW index over int8 scalar-quantized vectors (inner product), trained on vectors."""
+    import faiss
+
+    index = faiss.IndexHNSWSQ(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.train(vectors) # Learns the per-dimension value ranges used for quantization
+    return index
+
+def _recall_at_k(vectors: np.ndarray, k: int = 10, sample_size: int = 100) -> float:
     """
-    Creates and persists a ChromaDB vector store from text chunks.
-    If the directory exists, it loads the existing store.
+    Fraction of the exact top-k neighbors (FP32 inner product) that an index built with the
+    production settings returns for held-out queries: up to sample_size vectors (at most a
+    tenth of them) are left out of a scratch index and used to query it. Needs >= 2 vectors.
     """
-    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL_NAME, openai_api_key=openai_api_key)
-    
-    # Check if the ChromaDB directory already exists and contains data
-    if os.path.exists(CHROMA_DB_DIR) and os.listdir(CHROMA_DB_DIR):
-        print(f"Loading existing ChromaDB from {CHROMA_DB_DIR}...")
-        vectorstore = Chroma(persist_directory=CHROMA_DB_DIR, embedding_function=embeddings)
-        print("ChromaDB loaded successfully.")
+    rng = np.random.default_rng(0)
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[rng.choice(len(vectors), size=min(sample_size, max(1, len(vectors) // 10)), replace=False)] = True
+    queries, indexed = vectors[held_out], vectors[~held_out]
+    k = min(k, len(indexed))
+
+    index = _new_hnsw_index(indexed)
+    index.add(indexed)
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    exact = np.argpartition(-(queries @ indexed.T), k - 1, axis=1)[:, :k]
+    _, approx = index.search(queries, k)
+    return float(np.mean([len(set(e) & set(a)) / k for e, a in zip(exact.tolist(), approx.tolist())]))
+
+async def _embed_all(texts: dict, openai_api_key: str, embedding_cache: dict):
+    """
+    Embeds {key: text} in batches of EMBEDDING_BATCH_SIZE, keeping up to
+    EMBEDDING_CONCURRENCY embeddings requests in flight at once.
+    Each batch's vectors are stored in embedding_cache under their keys as soon as it
+    finishes; if a batch fails, the others still complete before the first error is raised.
+    """
+    import httpx
+    from openai import AsyncOpenAI
+
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+    # One HTTP/2 connection pool for every batch; closed together with the client below
+    client = AsyncOpenAI(
+        api_key=openai_api_key,
+        http_client=httpx.AsyncClient(
+            http2=True, timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=EMBEDDING_CONCURRENCY, max_keepalive_connections=EMBEDDING_CONCURRENCY),
+        ),
+    )
+    keys = list(texts)
+    batches = [keys[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(keys), EMBEDDING_BATCH_SIZE)]
+    embedded = 0
+
+    async def embed_batch(batch_keys: list):
+        nonlocal embedded
+        async with semaphore:
+            response = await client.embeddings.create(model=EMBEDDING_MODEL_NAME, input=[texts[key] for key in batch_keys])
+        for key, item in zip(batch_keys, sorted(response.data, key=lambda item: item.index)):
+            embedding_cache[key] = np.asarray(item.embedding, dtype=np.float32)
+        embedded += len(batch_keys)
+        print(f"Embedded {embedded}/{len(keys)} chunks...")
+
+    try:
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches), return_exceptions=True)
+    finally:
+        await client.close()
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        raise errors[0]
+
+def vector_store_key(pdf_path: str = LOCAL_PDF_PATH, pdf_sha256: str = None) -> str:
+    """
+    Identifies the vector store built from pdf_path with the current chunking, embedding model and index layout.
+    pdf_sha256, if given, is the PDF's precomputed SHA-256.
+    """
+    return (
+        (pdf_sha256 or file_sha256(pdf_path))[:16]
+        + f"_{CHUNK_SIZE}_{CHUNK_OVERLAP}_{_CHUNKING_VERSION}_{EMBEDDING_MODEL_NAME}_{_INDEX_LAYOUT}"
+    )
+
+def create_vector_store(chunks: list, openai_api_key: str, pdf_path: str = LOCAL_PDF_PATH, http_client=None, pdf_sha256: str = None) -> FAISS:
+    """
+    Creates and persists a FAISS (HNSW over int8-quantized unit vectors, inner product) vector store from text chunks.
+    The store lives in a subdirectory of VECTOR_STORE_DIR keyed on the PDF hash,
+    chunking parameters and embedding model; if it already exists it is loaded.
+    Chunk embeddings are cached by content hash so a rebuild only embeds new chunks.
+    http_client, if given, is the shared httpx.Client used for query embeddings.
+    pdf_sha256, if given, is the PDF's precomputed SHA-256.
+    """
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from normalized_embeddings import NormalizedOpenAIEmbeddings
+
+    embeddings = NormalizedOpenAIEmbeddings(model=EMBEDDING_MODEL_NAME, openai_api_key=openai_api_key, http_client=http_client)
+
+    persist_dir = os.path.join(VECTOR_STORE_DIR, vector_store_key(pdf_path, pdf_sha256))
+
+    # Check if the FAISS index for these inputs already exists
+    if os.path.exists(os.path.join(persist_dir, "index.faiss")):
+        print(f"Loading existing FAISS index from {persist_dir}...")
+        # The docstore pickle is written by this application, so loading it is safe
+        vectorstore = FAISS.load_local(
+            persist_dir, embeddings, allow_dangerous_deserialization=True,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
+        print("FAISS index loaded successfully.")
     else:
-        print(f"Creating new ChromaDB and persisting to {CHROMA_DB_DIR}...")
+        print(f"Creating new FAISS index and persisting to {persist_dir}...")
         print("This may take a few minutes depending on the PDF size and internet speed for embeddings...")
 
         try:
-            vectorstore = Chroma.from_documents(
-                documents=chunks,
-                embedding=embeddings,
-                persist_directory=CHROMA_DB_DIR
+            # Reuse embeddings of chunks whose text is unchanged since a previous build
+            embedding_cache = _load_embedding_cache(EMBEDDING_CACHE_PATH)
+            chunk_keys = [hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest() for chunk in chunks]
+            missing = {key: chunk.page_content for key, chunk in zip(chunk_keys, chunks) if key not in embedding_cache}
+            print(f"Reusing {len(chunks) - len(missing)} cached embeddings; embedding {len(missing)} new chunks.")
+            # Keep only the chunks of this build, so the cache doesn't grow with every PDF version
+            current_keys = set(chunk_keys)
+            pruned = len(embedding_cache) - len(current_keys.intersection(embedding_cache))
+            embedding_cache = {key: vector for key, vector in embedding_cache.items() if key in current_keys}
+
+            # Embed in fixed-size batches with several requests in flight at once
+            if missing:
+                try:
+                    asyncio.run(_embed_all(missing, openai_api_key, embedding_cache))
+                finally:
+                    # Saved even if a batch failed, so the next run only embeds what is still missing
+                    _save_embedding_cache(EMBEDDING_CACHE_PATH, embedding_cache)
+            elif pruned:
+                _save_embedding_cache(EMBEDDING_CACHE_PATH, embedding_cache)
+
+            # HNSW graph over int8 scalar-quantized vectors: approximate search in ~log(N) instead of
+            # a full scan, with 1 byte per dimension stored instead of 4
+            vectors = np.ascontiguousarray([embedding_cache[key] for key in chunk_keys], dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) # Unit vectors: inner product == cosine similarity
+            index = _new_hnsw_index(vectors)
+            vectorstore = FAISS(
+                embedding_function=embeddings,
+                index=index,
+                docstore=InMemoryDocstore(),
+                index_to_docstore_id={},
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+            )
+            vectorstore.add_embeddings(
+                text_embeddings=list(zip([chunk.page_content for chunk in chunks], vectors)),
+                metadatas=[chunk.metadata for chunk in chunks],
             )
-            vectorstore.persist()
-            print("ChromaDB created and persisted successfully.")
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+            if VERIFY_INDEX_RECALL and len(vectors) > 1:
+                try:
+                    print(f"Recall@10 of the quantized index on held-out queries vs exact FP32 search: {_recall_at_k(vectors):.3f}")
+                except Exception as e: # A diagnostic; never fail the build over it
+                    print(f"Could not measure index recall: {e}")
+            vectorstore.save_local(persist_dir) # Writes index.faiss (faiss.write_index) and index.pkl
+            print("FAISS index created and persisted successfully.")
         except Exception as e:
-            print(f"Error creating/persisting ChromaDB: {e}")
+            print(f"Error creating/persisting FAISS index: {e}")
             print("Please ensure your OpenAI API key is valid and you have an active internet connection.")
             # Re-raise or handle appropriately, possibly exiting here
             raise # Re-raise the exception so app.py can catch it and exit cleanly
 
+    vectorstore.index.hnsw.efSearch = HNSW_EF_SEARCH # Search-time breadth of the HNSW graph walk
     return vectorstore
 
-def build_conversational_rag_chain(vectorstore: Chroma, openai_api_key: str, cohere_api_key: str = None):
+class QueryEmbeddingRetriever(BaseRetriever):
+    """
+    Wraps a retriever so a query the caller has already embedded (for the answer cache)
+    is searched with that embedding instead of being sent to the embeddings API again.
+    """
+    retriever: BaseRetriever
+    query_embeddings: dict = {}
+
+    @staticmethod
+    def _key(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def _retrieve_by_vector(self, query: str, query_embedding) -> list:
+        """Runs the wrapped retrieval from an already computed query embedding."""
+        # The wrapped retriever is a vector store retriever, optionally inside a ContextualCompressionRetriever
+        compressor = getattr(self.retriever, "base_compressor", None)
+        vector_retriever = getattr(self.retriever, "base_retriever", self.retriever)
+        docs = vector_retriever.vectorstore.similarity_search_by_vector(query_embedding, **vector_retriever.search_kwargs)
+        if compressor is not None:
+            docs = list(compressor.compress_documents(docs, query))
+        return docs
+
+    def provide_embedding(self, query: str, query_embedding):
+        """Registers the embedding of query, used if the next retrieval is for that same query."""
+        self.query_embeddings[self._key(query)] = query_embedding
+
+    def clear_embeddings(self):
+        """Discards registered embeddings that were never used."""
+        self.query_embeddings.clear()
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list:
+        query_embedding = self.query_embeddings.pop(self._key(query), None)
+        if query_embedding is not None:
+            return self._retrieve_by_vector(query, query_embedding)
+        return self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+
+def build_conversational_rag_chain(vectorstore: FAISS, openai_api_key: str, cohere_api_key: str = None, http_client=None):
     """
     Builds a LangChain ConversationalRetrievalChain for RAG with chat history,
     optionally including a re-ranking step.
+    http_client, if given, is the shared httpx.Client used for all chat completions.
     """
-    # Initialize the LLM for chat
-    llm = ChatOpenAI(model_name=CHAT_MODEL_NAME, temperature=TEMPERATURE, openai_api_key=openai_api_key)
+    from langchain_openai import ChatOpenAI
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain.memory import ConversationSummaryBufferMemory
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.callbacks import StreamingStdOutCallbackHandler
+
+    # Initialize the LLM for chat; answer tokens are streamed to stdout as they are generated
+    llm = ChatOpenAI(
+        model_name=CHAT_MODEL_NAME, temperature=TEMPERATURE, openai_api_key=openai_api_key, http_client=http_client,
+        streaming=True, callbacks=[StreamingStdOutCallbackHandler()]
+    )
+    # Separate non-streaming LLM for rephrasing follow-up questions, so the rephrased question is not printed
+    condense_question_llm = ChatOpenAI(
+        model_name=CHAT_MODEL_NAME, temperature=TEMPERATURE, openai_api_key=openai_api_key, http_client=http_client
+    )
     # llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0.5, api_key=openai_api_key)
 
 
-    # Initialize memory for chat history
-    memory = ConversationBufferMemory(
+    # Initialize memory for chat history: recent turns verbatim, older turns folded into a running summary
+    # so the prompt stays under MEMORY_MAX_TOKEN_LIMIT tokens however long the conversation gets
+    memory = ConversationSummaryBufferMemory(
+        llm=condense_question_llm, # Non-streaming, so summaries are not printed
+        max_token_limit=MEMORY_MAX_TOKEN_LIMIT,
         memory_key="chat_history", 
         return_messages=True, 
         output_key='answer'
     )
 
-    # Custom prompt for the conversational chain
-    qa_prompt_template = """
-    You are a helpful AI assistant specializing in the Aetna Better Health of Illinois Member Handbook.
-    Answer the user's question ONLY based on the provided context. 
-    If the answer is not found in the context, clearly state that you don't have enough information 
-    from the handbook to answer the question. Do not make up answers.
-
-    First, provide a concise answer.
-    Then, in a separate "Reasoning" section, elaborate on your answer, directly quoting or paraphrasing key details from the context to support your response.
-
-    Context:
-    {context}
-
-    Question: {question}
-
-    Concise Answer:
-    Reasoning:
-    """
-    QA_CHAIN_PROMPT = PromptTemplate.from_template(qa_prompt_template)
+    # Custom prompt for the conversational chain: the static system instructions form an
+    # identical prefix on every call (eligible for OpenAI prompt caching), followed by the
+    # per-turn retrieved context and question
+    QA_CHAIN_PROMPT = ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_PROMPT),
+        ("human", HUMAN_PROMPT),
+    ])
 
     # --- Retriever Setup (with optional Re-ranking) ---
     # Base retriever: retrieves a larger set of candidates for re-ranking
@@ -112,6 +381,8 @@ def build_conversational_rag_chain(vectorstore: Chroma, openai_api_key: str, coh
     if cohere_api_key:
         try:
             from config import RERANK_MODEL_NAME, RERANK_TOP_N
+            from langchain.retrievers.contextual_compression import ContextualCompressionRetriever
+            from langchain.retrievers.document_compressors import CohereRerank
             compressor = CohereRerank(model=RERANK_MODEL_NAME, cohere_api_key=cohere_api_key)
             retriever = ContextualCompressionRetriever(
                 base_retriever=base_retriever,
@@ -126,10 +397,14 @@ def build_conversational_rag_chain(vectorstore: Chroma, openai_api_key: str, coh
         print("COHERE_API_KEY not found. Skipping re-ranking and using standard vector search.")
         retriever = vectorstore.as_retriever(search_kwargs={"k": 5}) # Default k if no reranker
 
+    # Allow app.py to hand over the question embedding it already computed for the answer cache
+    retriever = QueryEmbeddingRetriever(retriever=retriever)
+
 
     # Build the ConversationalRetrievalChain
     conversation_chain = ConversationalRetrievalChain.from_llm(
         llm=llm,
+        condense_question_llm=condense_question_llm,
         retriever=retriever, # Use the configured retriever (with or without re-ranker)
         memory=memory,
         combine_docs_chain_kwargs={"prompt": QA_CHAIN_PROMPT},
@@ -145,7 +420,6 @@ if __name__ == "__main__":
     load_dotenv()
     
     # Dummy setup for testing
-    from langchain_core.documents import Document
     dummy_docs = [
         Document(page_content="This is a test document about health benefits.", metadata={"page": 1}),
         Document(page_content="Another document discussing insurance policies.", metadata={"page": 2})
@@ -0,0 +1,78 @@
+# test_rag_pipeline.py
+# Run with: python -m unittest
+import random
+import unittest
+from unittest import mock
+
+import tiktoken
+from langchain_core.documents import Document
+
+import rag_pipeline
+from config import CHUNK_SIZE
+
+# One token per byte: deterministic, needs no download, and exercises the same windowing as the real encoding
+_BYTE_ENCODING = tiktoken.Encoding(
+    name="bytes", pat_str=r"\s+|\S+", mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={}
+)
+
+def _random_page(rng: random.Random) -> str:
+    """Paragraphs of sentences of random words, with occasional single line breaks."""
+    paragraphs = []
+    for _ in range(rng.randint(1, 8)):
+        sentences = []
+        for _ in range(rng.randint(1, 12)):
+            words = ["".join(rng.choices("abcdefghij", k=rng.randint(1, 12))) for _ in range(rng.randint(1, 25))]
+            sentences.append(" ".join(words) + rng.choice([".", ".", "\n"]))
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+class GetTextChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(rag_pipeline, "_encoding", return_value=_BYTE_ENCODING)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _chunk(self, text: str) -> list:
+        with mock.patch("builtins.print"):
+            return rag_pipeline.get_text_chunks([Document(page_content=text, metadata={"page": 1})])
+
+    def assertCoversPage(self, text: str, chunks: list):
+        covered = [False] * len(text)
+        for chunk in chunks:
+            start = chunk.metadata["start_index"]
+            covered[start:start + len(chunk.page_content)] = [True] * len(chunk.page_content)
+        missing = [i for i, char in enumerate(text) if not covered[i] and not char.isspace()]
+        self.assertEqual(missing, [], f"characters {missing[:10]} are in no chunk")
+
+    def test_chunks_cover_every_non_blank_character(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            text = _random_page(rng)
+            self.assertCoversPage(text, self._chunk(text))
+
+    def test_page_tail_is_kept(self):
+        text = "Intro paragraph.\n\n" + " ".join(f"item{i}" for i in range(129)) + "\n\nCall 1-800-555-0199."
+        chunks = self._chunk(text)
+        self.assertTrue(chunks[-1].page_content.endswith("Call 1-800-555-0199."))
+        self.assertCoversPage(text, chunks)
+
+    def test_start_index_locates_chunk_in_page(self):
+        text = _random_page(random.Random(1))
+        for chunk in self._chunk(text):
+            start = chunk.metadata["start_index"]
+            self.assertEqual(text[start:start + len(chunk.page_content)], chunk.page_content)
+
+    def test_chunks_start_at_separators_and_respect_size(self):
+        rng = random.Random(2)
+        text = "\n\n".join(_random_page(rng) for _ in range(10))
+        chunks = self._chunk(text)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(_BYTE_ENCODING.encode(chunk.page_content)), CHUNK_SIZE)
+        for chunk in chunks[1:]:
+            # Random words leave a space within every overlap window, so no chunk starts mid-word
+            self.assertIn(text[chunk.metadata["start_index"] - 1], " \n")
+
+if __name__ == "__main__":
+    unittest.main()